@@ -2,24 +2,51 @@
 """
 Redact the sensitive info from the YAML and TF config files.
 """
-from collections import deque
-from glob import glob
-from os import makedirs
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache, lru_cache
+from os import cpu_count, makedirs, scandir, stat
 from os.path import abspath, commonpath, dirname, isfile, join, relpath, splitext
-from typing import Optional, Tuple
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
 from urllib.parse import urlparse
 
 import click
-import tiktoken
 from inflect import engine
 from marko import Markdown
-from marko.element import Element
 from marko.inline import Link
 
 SECRET_LENGTH_REQUIREMENT = 10
+# The shortest length for which the 0.45 token ratio exceeds 12 tokens.
+LONG_VALUE_LENGTH = int(12 / 0.45) + 1
+TOKEN_COUNT_CACHE_SIZE = 8192
+
+_SECRET_HINT = re.compile(r"token|password|secret|apikey|api_key", re.IGNORECASE)
+_DIGIT = re.compile(r"\d")
+# The line boundaries recognized by `str.splitlines`, for use in regex character classes.
+_LINE_BREAKS = r"\n\r\v\f\x1c-\x1e\x85\u2028\u2029"
+# Values that can pass `tokens_look_random`: those meeting the secret minimum requirement
+# and those of at least `LONG_VALUE_LENGTH`.
+_MAYBE_RANDOM = re.compile(
+    r"(?=.*\d).{%d,}|.{%d,}" % (SECRET_LENGTH_REQUIREMENT, LONG_VALUE_LENGTH), re.DOTALL
+)
+
 
 plural = engine().no
-tokenizer = tiktoken.encoding_for_model("gpt-4")
+markdown = Markdown()
+# Output directories already created by this process, to skip the repeated makedirs calls.
+_made_dirs: set[str] = set()
+# Token counts of the value parts seen by this process, least recently used first, so that the
+# values recurring across files are only tokenized once.
+_token_count_cache: dict[str, int] = {}
+
+
+@cache
+def _tokenizer():
+    """The tokenizer is loaded on first use, so that importing this module stays cheap."""
+    import tiktoken  # pylint: disable=import-outside-toplevel
+
+    return tiktoken.encoding_for_model("gpt-4")
 
 
 def as_file_destination(dest: str, source: str, base: str) -> Optional[str]:
@@ -31,6 +58,12 @@ def as_file_destination(dest: str, source: str, base: str) -> Optional[str]:
     :param base: The base directory for all the directories, e.g. '/home'
     :return: Converted file path relative to `base`; None if the file is outside the base directory
     """
+    return _resolve_destination(dest, dirname(source), base)
+
+
+@lru_cache(maxsize=4096)
+def _resolve_destination(dest, source_dir, base):
+    """The cached part of `as_file_destination`, as the same links recur across a directory."""
     try:
         url = urlparse(dest)
         if url.scheme:
@@ -38,53 +71,208 @@ def as_file_destination(dest: str, source: str, base: str) -> Optional[str]:
     except ValueError:
         pass
 
-    resolved = abspath(join(base, dirname(source), dest))
+    resolved = abspath(join(base, source_dir, dest))
     if commonpath([resolved, base]) != base:
         return None
 
     return relpath(resolved, base)
 
 
+def iter_files(root) -> Iterator[str]:
+    """
+    Walk the directory tree like `glob("**/*", recursive=True)` does, but yield only the files.
+
+    :param root: The directory to walk.
+    :return: The file paths relative to `root`, skipping hidden files and directories, as well as
+        the directories that cannot be read or that are symlinks to their own ancestors.
+    """
+    try:
+        root_info = stat(root)
+    except OSError:
+        # A missing root has no files, as with `glob`.
+        return
+
+    stack = [("", frozenset([(root_info.st_dev, root_info.st_ino)]))]
+    while stack:
+        subdir, ancestors = stack.pop()
+        try:
+            with scandir(join(root, subdir)) as iterator:
+                entries = list(iterator)
+        except OSError:
+            # Unreadable directories are skipped, as `glob` does.
+            continue
+
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            path = join(subdir, entry.name)
+            if entry.is_dir():
+                # Symlinked directories are followed, except for the loops back to an ancestor.
+                try:
+                    info = entry.stat()
+                except OSError:
+                    continue
+                if (info.st_dev, info.st_ino) not in ancestors:
+                    stack.append((path, ancestors | {(info.st_dev, info.st_ino)}))
+            elif entry.is_file():
+                yield path
+
+
+def link_destinations(text) -> Iterator[str]:
+    """
+    :param text: The Markdown text to scan.
+    :return: The destinations of the links found in the text, in order of appearance.
+    """
+    stack = [markdown.parse(text)]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Link):
+            yield node.dest
+        if isinstance(getattr(node, "children", None), list):
+            stack.extend(reversed(node.children))
+
+
 def secret_minimum_requirement(value):
     """
     :param value: The value to check for the secret minimum requirement.
     :return: True if the value meets the secret minimum requirement, False otherwise.
     """
-    return any(x.isdigit() for x in value) and len(value) >= SECRET_LENGTH_REQUIREMENT
+    return len(value) >= SECRET_LENGTH_REQUIREMENT and _DIGIT.search(value) is not None
+
+
+def tokens_look_random(value, token_count):
+    """
+    Check if the given value appears to be random, given the number of tokens it encodes to.
+
+    :param value: The value to be checked, without any whitespace.
+    :param token_count: The number of tokens the tokenizer splits the value into.
+    :return: True if the value appears to be random, False otherwise.
+    """
+    looks_random = secret_minimum_requirement(value) and token_count > (len(value) * 0.6)
+    if len(value) < LONG_VALUE_LENGTH:
+        return looks_random
 
+    return looks_random or token_count > (len(value) * 0.45)
 
-def value_looks_random(value):
+
+def count_tokens(values) -> dict[str, int]:
+    """
+    Tokenize the whitespace-separated parts of the values that might look random, in one batch.
+    The parts already tokenized by this process are taken from a cache instead.
+
+    :param values: The values to be checked later with `value_looks_random`.
+    :return: A mapping from those parts to the number of tokens they are split into.
+    """
+    token_counts = {}
+    missing = []
+    for part in dict.fromkeys(
+        part for value in values for part in value.split(" ") if _MAYBE_RANDOM.fullmatch(part)
+    ):
+        if (token_count := _token_count_cache.pop(part, None)) is None:
+            missing.append(part)
+        else:
+            token_counts[part] = _token_count_cache[part] = token_count
+
+    if missing:
+        # Files are already redacted in parallel processes, so a single tiktoken thread suffices.
+        encoded = _tokenizer().encode_ordinary_batch(missing, num_threads=1)
+        for part, tokens in zip(missing, encoded):
+            token_counts[part] = _token_count_cache[part] = len(tokens)
+        while len(_token_count_cache) > TOKEN_COUNT_CACHE_SIZE:
+            del _token_count_cache[next(iter(_token_count_cache))]
+
+    return token_counts
+
+
+def value_looks_random(value, token_counts=None):
     """
     Check if the given value appears to be random using the tokenization algorithm.
 
     :param value: The value to be checked.
+    :param token_counts: The result of `count_tokens` for the value; computed if not given.
     :return: True if the value appears to be random, False otherwise.
     """
-    if " " in value:
-        return any(value_looks_random(part) for part in value.split(" "))
+    if token_counts is None:
+        token_counts = count_tokens([value])
 
-    return (
-        secret_minimum_requirement(value)
-        and len(tokenizer.encode(value)) > (len(value) * 0.6)
-        or len(tokenizer.encode(value)) > (len(value) * 0.45) > 12
+    return any(
+        part in token_counts and tokens_look_random(part, token_counts[part])
+        for part in value.split(" ")
     )
 
 
-def is_a_secret(key, value):
-    """We define secret as:
+def key_hints_secret(key):
+    """
+    :param key: The key the value is assigned to.
+    :return: True if the key name suggests that the value is a secret.
+    """
+    return _SECRET_HINT.search(key) is not None
+
+
+def is_a_secret(key, value, token_counts=None):
+    """We define secret as either:
     - a sequence with a digit
-    - of length at least 10
-    - which is either
-       - hinted with the key containing one of two strings OR
-       - is part of the value separated by the whitespace which looks random for ChatGPT tokenizer
-    """
-    key = key.lower()
-    return (
-        secret_minimum_requirement(value)
-        if "token" in key or "password" in key
-        else value_looks_random(value)
+      of length at least 10
+      which is hinted with the key containing one of the `_SECRET_HINT` strings OR
+    - a value with a part separated by the whitespace which looks random for ChatGPT tokenizer
+
+    The `token_counts` from `count_tokens` can be passed in to tokenize many values in one batch.
+    """
+    if key_hints_secret(key) and secret_minimum_requirement(value):
+        return True
+
+    return value_looks_random(value, token_counts)
+
+
+def _make_redactor(sep, fallback_sep):
+    """
+    Build the redaction function for a file format, with its separators fixed in a line pattern
+    that is compiled once.
+
+    :param sep: The key/value separator used where the line contains it, e.g. ':' for YAML.
+    :param fallback_sep: The separator used for the lines that don't contain `sep`.
+    :return: A function taking the text and returning the redacted text and the redacted count.
+    """
+    # Key/value lines that are not comments, split at the first separator. A single space after
+    # the separator is kept out of the value, so that the redacted line preserves it, and so is
+    # a trailing comment. Lines end at the same characters as for `str.splitlines`.
+    line_pattern = re.compile(
+        rf"(?:\A|(?<=[{_LINE_BREAKS}]))(?![^\S{_LINE_BREAKS}]*#)"
+        rf"(?P<key>[^{sep}{_LINE_BREAKS}]*(?={sep})"
+        rf"|[^{fallback_sep}{_LINE_BREAKS}]*(?={fallback_sep}))"
+        rf"(?P<sep>[{sep}{fallback_sep}]) ?(?P<value>[^#{_LINE_BREAKS}]*)[^{_LINE_BREAKS}]*"
     )
 
+    def redact_lines(text) -> Tuple[str, int]:
+        candidates = [
+            (match, match["key"], match["value"].strip(" \"',"))
+            for match in line_pattern.finditer(text)
+            if match["key"]
+        ]
+        token_counts = count_tokens(
+            value
+            for _, key, value in candidates
+            if not (key_hints_secret(key) and secret_minimum_requirement(value))
+        )
+
+        out_parts = []
+        position = count_redacted = 0
+        for match, key, value in candidates:
+            if is_a_secret(key, value, token_counts):
+                out_parts.append(text[position : match.start("value")])
+                out_parts.append("REDACTED")
+                position = match.end()
+                count_redacted += 1
+
+        out_parts.append(text[position:])
+        return "".join(out_parts), count_redacted
+
+    return redact_lines
+
+
+_redact_yaml = _make_redactor(":", "=")
+_redact_other = _make_redactor("=", ":")
+
 
 def redact_text(text, file_ext) -> Tuple[str, int]:
     """
@@ -98,36 +286,23 @@ def redact_text(text, file_ext) -> Tuple[str, int]:
 
     The resulting text is returned along with the count of redacted values.
     """
-    count_redacted = 0
-
-    def gen():
-        nonlocal count_redacted
+    redact_lines = _redact_yaml if file_ext == ".yaml" else _redact_other
+    return redact_lines(text)
 
-        for line in text.splitlines(keepends=True):
-            sep = ":" if file_ext == ".yaml" else "="
-
-            if "#" in line and not line.partition("#")[0].strip():
-                yield line
-                continue
-
-            if sep not in line and "=" in line:
-                sep = "="
-
-            if sep not in line and ":" in line:
-                sep = ":"
-
-            key, sep_, value = line.partition(sep)
-            stripped_value = value.partition("#")[0].strip(" \n\"',")
-            if key and sep_ and value and is_a_secret(key, stripped_value):
-                yield key + sep_ + (" " if value[0] == " " else "") + "REDACTED" + (
-                    "\n" if value[-1] == "\n" else ""
-                )
-                count_redacted += 1
-            else:
-                yield line
 
-    out_text = "".join(gen())
-    return out_text, count_redacted
+def _write_output(out_dir, filename, write, *args, **kwargs):
+    """Call `write` on the output file path, creating its directory if necessary."""
+    output_file = Path(out_dir, filename)
+    output_dir = str(output_file.parent)
+    if output_dir not in _made_dirs:
+        makedirs(output_dir, exist_ok=True)
+        _made_dirs.add(output_dir)
+    try:
+        write(output_file, *args, **kwargs)
+    except FileNotFoundError:
+        # The directory was removed after this process created it, e.g. with a previous output.
+        makedirs(output_dir, exist_ok=True)
+        write(output_file, *args, **kwargs)
 
 
 def create_and_write(out_dir, filename, text):
@@ -138,10 +313,37 @@ def create_and_write(out_dir, filename, text):
     :param filename: The name of the file to create.
     :param text: The text to write to the file.
     """
-    output_file = join(out_dir, filename)
-    makedirs(dirname(output_file), exist_ok=True)
-    with open(output_file, "wt", encoding="utf-8") as output_stream:
-        output_stream.write(text)
+    _write_output(out_dir, filename, Path.write_text, text, encoding="utf-8")
+
+
+def create_and_write_bytes(out_dir, filename, data):
+    """
+    A simple helper to create and write unchanged contents to a file.
+
+    :param out_dir: The directory to create the file in.
+    :param filename: The name of the file to create.
+    :param data: The bytes to write to the file.
+    """
+    _write_output(out_dir, filename, Path.write_bytes, data)
+
+
+def redact_file(value_file, in_dir, out_dir) -> Optional[int]:
+    """
+    Redact a single YAML/TF file and write the result to the output directory.
+
+    :param value_file: The file path relative to both directories.
+    :param in_dir: The absolute input directory path.
+    :param out_dir: The absolute output directory path.
+    :return: The count of redacted values; None if the path is not a file.
+    """
+    fullname = join(in_dir, value_file)
+    if not isfile(fullname):
+        return None
+
+    text = Path(fullname).read_text(encoding="utf-8")
+    out_text, found_secrets = redact_text(text, splitext(value_file)[1])
+    create_and_write(out_dir, value_file, out_text)
+    return found_secrets
 
 
 class ProcessingMessage:
@@ -174,47 +376,44 @@ def redact(in_dir, out_dir):
     :param in_dir: Input directory path (relative to current working directory)
     :param out_dir: Output directory path (will be created if it does not exist)
     """
-    markdown = Markdown()
     referenced_files = set()
     in_dir = abspath(in_dir)
     out_dir = abspath(out_dir)
 
-    for md_file in glob("**/*.md", recursive=True, root_dir=in_dir):
+    for md_file in iter_files(in_dir):
+        if not md_file.endswith(".md"):
+            continue
         with ProcessingMessage(md_file):
             found_links = 0
-            with open(join(in_dir, md_file), "rt", encoding="utf-8") as input_stream:
-                text = input_stream.read()
-            document = markdown.parse(text)
-            queue = deque([document])
-            while queue:
-                node: Element = queue.popleft()
-                if hasattr(node, "children"):
-                    queue.extend(node.children)
-                if isinstance(node, Link):
-                    if file_dest := as_file_destination(node.dest, md_file, in_dir):
-                        found_links += 1
-                        referenced_files.add(file_dest)
+            data = Path(in_dir, md_file).read_bytes()
+            for dest in link_destinations(data.decode("utf-8")):
+                if file_dest := as_file_destination(dest, md_file, in_dir):
+                    found_links += 1
+                    referenced_files.add(file_dest)
             click.echo(
                 f"found {click.style(plural('link', found_links), 'blue', underline=True)}, ",
                 nl=False,
             )
-            create_and_write(out_dir, md_file, text)
-
-    for value_file in sorted(referenced_files):
-        try:
-            with ProcessingMessage(value_file):
-                fullname = join(in_dir, value_file)
-                if isfile(fullname):
-                    with open(fullname, "rt", encoding="utf-8") as input_stream:
-                        text = input_stream.read()
-                    out_text, found_secrets = redact_text(text, splitext(value_file)[1])
-                    click.echo(
-                        f"redacted {click.style(plural('secret', found_secrets), reverse=True)}, ",
-                        nl=False,
-                    )
-                    create_and_write(out_dir, value_file, out_text)
-        except FileNotFoundError:
-            pass
+            create_and_write_bytes(out_dir, md_file, data)
+
+    # Redaction is CPU-bound, so the files are processed in parallel and reported in order.
+    value_files = sorted(referenced_files)
+    if not value_files:
+        return
+
+    with ProcessPoolExecutor(max_workers=min(cpu_count() or 1, len(value_files))) as executor:
+        futures = [
+            executor.submit(redact_file, value_file, in_dir, out_dir) for value_file in value_files
+        ]
+        for value_file, future in zip(value_files, futures):
+            try:
+                with ProcessingMessage(value_file):
+                    found_secrets = future.result()
+                    if found_secrets is not None:
+                        secrets = click.style(plural("secret", found_secrets), reverse=True)
+                        click.echo(f"redacted {secrets}, ", nl=False)
+            except FileNotFoundError:
+                pass
 
 
 if __name__ == "__main__":
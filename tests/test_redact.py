@@ -1,6 +1,18 @@
 import unittest
+from os import makedirs, symlink
+from os.path import join
+from pathlib import Path
+from shutil import rmtree
+from tempfile import TemporaryDirectory
 
-from redact import as_file_destination, is_a_secret, redact_text
+from redact import (
+    as_file_destination,
+    create_and_write,
+    is_a_secret,
+    iter_files,
+    link_destinations,
+    redact_text,
+)
 
 
 class TestRedaction(unittest.TestCase):
@@ -26,8 +38,89 @@ class TestRedaction(unittest.TestCase):
             as_file_destination("../../file.txt", "/home/me/folder/file.md", "/home/me")
         )
 
+    def test_create_and_write(self):
+        with TemporaryDirectory() as root:
+            out_dir = join(root, "out")
+            for _ in range(2):
+                create_and_write(out_dir, "docs/file.md", "text")
+                self.assertEqual(
+                    Path(out_dir, "docs/file.md").read_text(encoding="utf-8"), "text"
+                )
+                rmtree(out_dir)
+
+    def test_iter_files(self):
+        with TemporaryDirectory() as root:
+            for directory in ("docs/sub", "empty", ".git"):
+                makedirs(join(root, directory))
+            for file in (
+                "README.md",
+                "docs/a.yaml",
+                "docs/sub/main.tf",
+                ".env",
+                ".git/HEAD",
+            ):
+                Path(root, file).write_text("", encoding="utf-8")
+            symlink("..", join(root, "docs/loop"))
+            symlink("docs", join(root, "alias"))
+            self.assertEqual(
+                sorted(iter_files(root)),
+                [
+                    "README.md",
+                    "alias/a.yaml",
+                    "alias/sub/main.tf",
+                    "docs/a.yaml",
+                    "docs/sub/main.tf",
+                ],
+            )
+            self.assertEqual(list(iter_files(join(root, "missing"))), [])
+
+    def test_link_destinations(self):
+        self.assertEqual(
+            list(
+                link_destinations(
+                    'See [config](../a.yaml) and [tf](main.tf "Title").\n'
+                    "Not an image: ![diagram](pic.png), but a [reference][ref].\n"
+                    "\n"
+                    "[ref]: sub/b.yaml\n"
+                )
+            ),
+            ["../a.yaml", "main.tf", "sub/b.yaml"],
+        )
+        self.assertEqual(
+            list(
+                link_destinations(
+                    "[![badge](img.png)](conf.yaml) [a [b] c](<my file.yaml>) "
+                    "[title](a.yaml 'T') [escaped](a\\_b.yaml)"
+                )
+            ),
+            ["conf.yaml", "my file.yaml", "a.yaml", "a_b.yaml"],
+        )
+        self.assertEqual(
+            list(
+                link_destinations(
+                    "`[span](span.yaml)`\n"
+                    "\n"
+                    "```\n"
+                    "[fenced](fenced.yaml)\n"
+                    "[unused]: fenced-definition.yaml\n"
+                    "```\n"
+                    "\n"
+                    "    [indented](indented.yaml)\n"
+                    "\n"
+                    "[unused]: definition.yaml\n"
+                )
+            ),
+            [],
+        )
+
     def test_is_a_secret(self):
         self.assertTrue(is_a_secret("my_password", "jshd_K176!"))
+        self.assertTrue(is_a_secret("client_secret", "jshd_K176!"))
+        self.assertTrue(is_a_secret("ApiKey", "jshd_K176!"))
+        self.assertTrue(
+            is_a_secret("client_secret", "kLpQzXvRtYwMnBhGfDsAeWqJuIoPlKmN")
+        )
+        self.assertTrue(is_a_secret("api_token", "kLpQzXvRtYwMnBhGfDsAeWqJuIoPlKmN"))
         self.assertTrue(
             is_a_secret("API_TOKEN", "nBJGKTKB68Gvbsdf6aKJGKUTusdbfkIUjsdfvk")
         )
@@ -48,6 +141,12 @@ class TestRedaction(unittest.TestCase):
             redact_text("password: jasghDSGF2346", ".yaml"),  # gitleaks:allow
             ("password: REDACTED", 1),
         )
+        self.assertEqual(
+            redact_text(
+                "a: b\fpassword: jasghDSGF2346\u2028c: d", ".yaml"  # gitleaks:allow
+            ),
+            ("a: b\fpassword: REDACTED\u2028c: d", 1),
+        )
         self.assertEqual(
             redact_text("- --zone=hwer5uy6528hHJG", ".yaml"), ("- --zone=REDACTED", 1)
         )
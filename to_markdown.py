@@ -6,12 +6,12 @@ Activates syntax highlighting for all code and adds a preamble to every file, in
 This is the format consumed by the Zola Static Site Generator.
 """
 
-from glob import glob
-from os.path import basename, isfile, join, splitext
+from os.path import basename, splitext
+from pathlib import Path
 from typing import Iterable
 
 import click
-from redact import ProcessingMessage, create_and_write
+from redact import ProcessingMessage, create_and_write, iter_files
 
 LANGUAGE_BY_EXTENSION = {
     "yml": "yaml",
@@ -42,27 +42,24 @@ def to_markdown(in_dir, out_dir):
     :param out_dir: Output directory path (will be created if it does not exist)
     """
 
-    for filename in glob("**/*", recursive=True, root_dir=in_dir):
-        fullname = join(in_dir, filename)
-        if isfile(fullname):
-            with ProcessingMessage(filename):
-                _, split2 = splitext(filename)
-                ext = split2.lower()[1:] if split2 and split2[0] == "." else ""
-
-                with open(fullname, "rt", encoding="utf-8") as input_stream:
-                    text = input_stream.read()
-
-                if ext == "md":
-                    md_file = filename
-                    header, *out_lines = text.splitlines()
-                    title = header.lstrip("#").strip()
-                else:
-                    md_file = filename + ".md"
-                    out_lines = md_code(LANGUAGE_BY_EXTENSION.get(ext, ext), text)
-                    title = basename(filename)
-
-                out_text = "\n".join((*zola_preamble(title), *out_lines))
-                create_and_write(out_dir, md_file, out_text)
+    for filename in iter_files(in_dir):
+        with ProcessingMessage(filename):
+            _, split2 = splitext(filename)
+            ext = split2.lower()[1:] if split2 and split2[0] == "." else ""
+
+            text = Path(in_dir, filename).read_text(encoding="utf-8")
+
+            if ext == "md":
+                md_file = filename
+                header, *out_lines = text.splitlines()
+                title = header.lstrip("#").strip()
+            else:
+                md_file = filename + ".md"
+                out_lines = md_code(LANGUAGE_BY_EXTENSION.get(ext, ext), text)
+                title = basename(filename)
+
+            out_text = "\n".join((*zola_preamble(title), *out_lines))
+            create_and_write(out_dir, md_file, out_text)
 
 
 if __name__ == "__main__":